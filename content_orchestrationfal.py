@@ -1,13 +1,60 @@
+import asyncio
+import atexit
+import hashlib
 import json
-import copy
+import logging
+import logging.handlers
+import math
 import os
-from typing import Dict, Any, Optional, List, TypedDict
-from jinja2 import Template
-from google import genai
-import fal_client
-
-# LangGraph imports
-from langgraph.graph import StateGraph, END
+import queue
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import cache, lru_cache
+from typing import TYPE_CHECKING, Dict, Any, AsyncIterator, NamedTuple, Optional, List, Tuple, TypedDict
+
+try:
+    import orjson  # Optional: C-accelerated JSON; the stdlib parser is used otherwise
+except ImportError:
+    orjson = None
+
+try:
+    import pybase64 as base64  # Optional: SIMD base64, same API as the stdlib module
+except ImportError:
+    import base64
+
+logger = logging.getLogger(__name__)
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+_log_setup_lock = threading.Lock()
+
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Routes this module's log records through a queue to a background thread that
+    writes them to stdout, so concurrent graph nodes only enqueue a record instead
+    of contending for the stdout lock. The handler is installed once; later calls
+    only change the level, e.g. setup_logging(logging.DEBUG) after main.py's call.
+    """
+    global _log_listener
+    with _log_setup_lock:
+        logger.setLevel(level)
+        if _log_listener is None:
+            log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+            logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            logger.propagate = False
+            listener.start()
+            atexit.register(listener.stop)
+            _log_listener = listener
+        return _log_listener
+
+# The SDKs (google-genai, fal-client, LangGraph) are imported on first use: they
+# cost hundreds of milliseconds to import, and plan/prompt building needs none of them.
+if TYPE_CHECKING:
+    from google import genai
+    import fal_client
 
 # ======================================================
 # AgentState Definition
@@ -23,6 +70,7 @@ class AgentState(TypedDict):
     # Intermediate Data
     generation_plan: Dict[str, Any]
     text_model_input: str
+    media_model_input: Optional[str] # Engineered media prompt (constraints + user data)
     media_payload: Dict[str, Any]
     visual_prompt: Optional[str] # Refined visual prompt from LLM
     
@@ -37,38 +85,338 @@ class AgentState(TypedDict):
 # ======================================================
 # Gemini Setup (from content_orchestrationfal.py)
 # ======================================================
-client = genai.Client(
-    api_key=os.environ.get("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY") # Use env var
-)
-MODEL_NAME = "gemini-2.5-flash"
+@cache
+def get_gemini_client() -> "genai.Client":
+    # Created on first use (once per process), so importing this module makes no
+    # client and each `uvicorn --workers N` process builds its own after forking.
+    from google import genai
+    return genai.Client(
+        api_key=os.environ.get("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY") # Use env var
+    )
 
-def generate_text_with_gemini(prompt: str) -> str:
+MODEL_NAME = "gemini-2.5-flash"
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "max_output_tokens": 2000
+}
+
+# In-process LRU of Gemini responses keyed by sha256(model + prompt + config).
+# Identical prompts (e.g. re-running the same content idea) return instantly
+# instead of paying another round-trip. Set GEMINI_CACHE_SIZE=0 to disable.
+GEMINI_CACHE_SIZE = int(os.environ.get("GEMINI_CACHE_SIZE", "1024"))
+_gemini_cache: "OrderedDict[str, str]" = OrderedDict()
+_gemini_cache_lock = threading.Lock()
+
+def canonical_json(value: Any) -> bytes:
+    """Serializes value with sorted keys, for hashing and cache keys; orjson when available."""
+    if orjson:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+
+def _gemini_cache_key(prompt: str, config: Dict[str, Any]) -> str:
+    payload = canonical_json({"model": MODEL_NAME, "prompt": prompt, "config": config})
+    return hashlib.sha256(payload).hexdigest()
+
+def _gemini_cache_get(key: str) -> Optional[str]:
+    with _gemini_cache_lock:
+        text = _gemini_cache.get(key)
+        if text is not None:
+            _gemini_cache.move_to_end(key)
+        return text
+
+def _gemini_cache_set(key: str, text: str) -> None:
+    if GEMINI_CACHE_SIZE <= 0:
+        return
+    with _gemini_cache_lock:
+        _gemini_cache[key] = text
+        _gemini_cache.move_to_end(key)
+        while len(_gemini_cache) > GEMINI_CACHE_SIZE:
+            _gemini_cache.popitem(last=False)
+
+def _gemini_cache_discard(key: str) -> None:
+    with _gemini_cache_lock:
+        _gemini_cache.pop(key, None)
+
+class EmptyResponseError(RuntimeError):
+    """Gemini finished without any text, e.g. a blocked prompt."""
+
+async def _generate_text(prompt: str, config: Dict[str, Any] = GENERATION_CONFIG) -> str:
+    """Calls Gemini through the response cache. Raises on failure (or an empty reply) so errors are never cached."""
+    cache_key = _gemini_cache_key(prompt, config)
+    cached = _gemini_cache_get(cache_key)
+    if cached is not None:
+        return cached
+    text = "".join([chunk async for chunk in stream_text_with_gemini(prompt, config)]).strip()
+    if not text:
+        raise EmptyResponseError("Gemini returned no text")
+    _gemini_cache_set(cache_key, text)
+    return text
+
+@lru_cache(maxsize=8)
+def _sdk_generation_config(config_json: bytes) -> "genai.types.GenerateContentConfig":
+    # Validated into the SDK's config model once per distinct config rather than on
+    # every call; the plain dicts stay the source of truth (and the cache key input).
+    # Keyed on canonical JSON because configs may nest (response_schema).
+    from google.genai import types
+    return types.GenerateContentConfig(**json.loads(config_json))
+
+async def stream_text_with_gemini(prompt: str, config: Dict[str, Any] = GENERATION_CONFIG) -> AsyncIterator[str]:
+    """
+    Yields response text as Gemini decodes it instead of waiting for the full reply.
+    Uses the SDK's async client, so a pending reply never holds a worker thread.
+    """
+    async for chunk in await get_gemini_client().aio.models.generate_content_stream(
+        model=MODEL_NAME,
+        contents=prompt,
+        config=_sdk_generation_config(canonical_json(config))
+    ):
+        if chunk.text:
+            yield chunk.text
+
+async def generate_text_with_gemini(prompt: str) -> str:
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-            config={
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "max_output_tokens": 2000
-            }
-        )
-        return response.text.strip()
+        return await _generate_text(prompt)
     except Exception as e:
         return f"Error generating text with Gemini: {str(e)}"
 
+# One request returns both the post and the visual prompt, saving the second
+# round-trip (and prefill) that a separate refinement call would cost.
+# The schema makes Gemini emit exactly these keys instead of relying on the prompt.
+JSON_GENERATION_CONFIG = {
+    **GENERATION_CONFIG,
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "OBJECT",
+        "properties": {"post": {"type": "STRING"}, "visual_prompt": {"type": "STRING"}},
+        "required": ["post", "visual_prompt"],
+        "property_ordering": ["post", "visual_prompt"]
+    }
+}
+
+# Both instruction suffixes start with a blank line: the model inputs they are
+# appended to are tightened, so they end without a trailing newline.
+COMBINED_OUTPUT_INSTRUCTIONS = """
+
+ADDITIONAL TASK:
+After writing the post, create a detailed visual prompt for an {media_type} generation that matches it.
+Focus on style, lighting, and composition.
+
+RESPONSE FORMAT (overrides FINAL OUTPUT above):
+Return strict JSON with exactly two string keys:
+- "post": the final post text
+- "visual_prompt": the visual prompt
+"""
+
+async def generate_post_and_visual_prompt(text_model_input: str, media_type: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns (post_text, visual_prompt) from a single Gemini call, or None if the reply
+    is unusable. Raises if the call itself fails: retrying it as separate calls
+    would only multiply the failing requests (e.g. during an outage).
+    """
+    prompt = text_model_input + COMBINED_OUTPUT_INSTRUCTIONS.format(media_type=media_type)
+    try:
+        reply = await _generate_text(prompt, JSON_GENERATION_CONFIG)
+    except EmptyResponseError as e:
+        logger.warning("Combined reply is empty, falling back to separate calls: %s", e)
+        return None
+    try:
+        data = json.loads(reply)
+        post_text, visual_prompt = data["post"].strip(), data["visual_prompt"].strip()
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning("Combined reply is malformed, falling back to separate calls: %s", e)
+        # Don't keep serving a malformed reply from the cache.
+        _gemini_cache_discard(_gemini_cache_key(prompt, JSON_GENERATION_CONFIG))
+        return None
+    if not post_text or not visual_prompt:
+        logger.warning("Combined reply has an empty post or visual prompt, falling back to separate calls.")
+        return None
+    return post_text, visual_prompt
+
+VISUAL_PROMPT_DRAFT_INSTRUCTIONS = """
+
+RESPONSE FORMAT (overrides FINAL OUTPUT above):
+Do not produce the {media_type} itself. Instead write a detailed prompt for an {media_type}
+generation model that satisfies the brief above. Focus on style, lighting, and composition.
+Return only the prompt.
+"""
+
+async def draft_visual_prompt(media_model_input: Optional[str], media_type: str) -> Optional[str]:
+    """Writes a visual prompt from the media brief alone, so it can run alongside the post text call."""
+    if not media_model_input:
+        return None
+    try:
+        visual_prompt = (await _generate_text(
+            media_model_input + VISUAL_PROMPT_DRAFT_INSTRUCTIONS.format(media_type=media_type)
+        )).strip()
+    except Exception as e:
+        logger.warning("Visual prompt draft failed: %s", e)
+        return None
+    return visual_prompt or None
+
+async def refine_visual_prompt(post_text: str, media_type: str) -> str:
+    """Turns the generated post into a visual prompt; used only when the copywriter produced none."""
+    visual_prompt_request = f"Based on this social media post: '{post_text}', create a detailed visual prompt for an {media_type} generation. Focus on style, lighting, and composition. Return only the prompt."
+    return await _generate_text(visual_prompt_request)
+
 # ======================================================
 # fal.ai Setup (from content_orchestrationfal.py)
 # ======================================================
-# Ensure FAL_KEY is set in your environment
-os.environ["FAL_KEY"] = os.environ.get("FAL_KEY", "YOUR_FAL_API_KEY")
+@cache
+def get_fal_client() -> "fal_client.AsyncClient":
+    """
+    One shared async client for every fal.ai call: its httpx connection pool keeps
+    TLS sessions alive across uploads, images, carousel slides and videos instead
+    of paying DNS + handshake per request, and no worker thread is pinned while
+    a generation runs. FAL_KEY is read from the environment on first use.
+    """
+    import fal_client
+    return fal_client.AsyncClient(key=os.environ.get("FAL_KEY"))
+
+# Queue polling backoff. fal_client's own subscribe() polls every 0.1 s. Images
+# finish within seconds, so their polls stay at most FAL_POLL_MAX_DELAY apart to
+# notice the result promptly; only long generations (veo3 runs for tens of
+# seconds) back off further.
+FAL_POLL_INITIAL_DELAY = 0.5
+FAL_POLL_MAX_DELAY = 1.0
+FAL_POLL_BACKOFF = 1.5
+_FAL_POLL_MAX_DELAYS = {"fal-ai/veo3": 5.0}
+
+# Results of finished jobs, keyed by sha256 of the application and its arguments,
+# so an identical generation (retry, A/B rerun) within FAL_RESULT_CACHE_TTL seconds
+# reuses the media instead of paying for another GPU run. Set the TTL to 0 to disable.
+# Only touched from the event loop, so it needs no lock.
+FAL_RESULT_CACHE_TTL = float(os.environ.get("FAL_RESULT_CACHE_TTL", "3600"))
+FAL_RESULT_CACHE_SIZE = int(os.environ.get("FAL_RESULT_CACHE_SIZE", "256"))
+_fal_result_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+async def run_fal_job(application: str, arguments: Dict[str, Any], output_key: str) -> Any:
+    """
+    Returns the result of a fal.ai job, from the result cache or by submitting it.
+    Only results carrying output_key (e.g. "images") are cached, so an unexpected
+    or moderated response is not replayed for the whole TTL.
+    """
+    if FAL_RESULT_CACHE_TTL <= 0 or FAL_RESULT_CACHE_SIZE <= 0:
+        return await _submit_fal_job(application, arguments)
+    cache_key = hashlib.sha256(canonical_json({"application": application, "arguments": arguments})).hexdigest()
+    now = time.monotonic()
+    entry = _fal_result_cache.get(cache_key)
+    if entry is not None and entry[0] > now:
+        _fal_result_cache.move_to_end(cache_key)
+        logger.info("fal.ai result served from cache.")
+        return entry[1]
+    result = await _submit_fal_job(application, arguments)
+    if not isinstance(result, dict) or not result.get(output_key):
+        return result
+    _fal_result_cache[cache_key] = (time.monotonic() + FAL_RESULT_CACHE_TTL, result)
+    _fal_result_cache.move_to_end(cache_key)
+    while len(_fal_result_cache) > FAL_RESULT_CACHE_SIZE:
+        _fal_result_cache.popitem(last=False)
+    return result
 
-def generate_image_with_fal(
+# Upper bound on fal.ai jobs in flight at once, shared by every request in the
+# process (carousel slides, images, videos), to stay within fal.ai rate limits.
+FAL_MAX_CONCURRENCY = int(os.environ.get("FAL_MAX_CONCURRENCY", "4"))
+_fal_job_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+def _fal_job_slot() -> asyncio.Semaphore:
+    # Created on the running loop at first use, and again if a new loop replaces it
+    # (e.g. run_demo's asyncio.run), since a semaphore cannot be shared across loops.
+    global _fal_job_slots
+    loop = asyncio.get_running_loop()
+    if _fal_job_slots is None or _fal_job_slots[0] is not loop:
+        _fal_job_slots = (loop, asyncio.Semaphore(max(1, FAL_MAX_CONCURRENCY)))
+    return _fal_job_slots[1]
+
+async def _submit_fal_job(application: str, arguments: Dict[str, Any]) -> Any:
+    """Submits a fal.ai job and polls it with exponential backoff, yielding the event loop while it waits."""
+    from fal_client import Completed
+    async with _fal_job_slot():
+        handle = await get_fal_client().submit(application, arguments=arguments)
+        delay = FAL_POLL_INITIAL_DELAY
+        max_delay = _FAL_POLL_MAX_DELAYS.get(application, FAL_POLL_MAX_DELAY)
+        while True:
+            status = await handle.status()
+            if isinstance(status, Completed):
+                if status.error:
+                    raise RuntimeError(status.error)
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * FAL_POLL_BACKOFF, max_delay)
+        return await handle.get()
+
+# Storage URLs of media already uploaded, keyed by sha256 of the content, so a
+# retry or a repeat post with the same reference image skips the re-upload.
+# Only touched from the event loop, so it needs no lock.
+FAL_UPLOAD_CACHE_SIZE = int(os.environ.get("FAL_UPLOAD_CACHE_SIZE", "128"))
+_fal_upload_cache: "OrderedDict[str, str]" = OrderedDict()
+
+async def upload_bytes_to_fal(data: bytes, content_type: str) -> str:
+    """Uploads raw media to fal storage and returns its URL. Raises if the upload fails."""
+    cache_key = hashlib.sha256(content_type.encode("utf-8") + b"\0" + data).hexdigest()
+    url = _fal_upload_cache.get(cache_key)
+    if url is not None:
+        _fal_upload_cache.move_to_end(cache_key)
+        return url
+    url = await get_fal_client().upload(data, content_type)
+    if FAL_UPLOAD_CACHE_SIZE > 0:
+        _fal_upload_cache[cache_key] = url
+        while len(_fal_upload_cache) > FAL_UPLOAD_CACHE_SIZE:
+            _fal_upload_cache.popitem(last=False)
+    return url
+
+class MediaUpload(NamedTuple):
+    """A user-uploaded file's raw bytes; the graph stages it to fal storage only if the media uses it."""
+    data: bytes
+    content_type: str
+
+def _data_uri(upload: MediaUpload) -> str:
+    # base64 output is pure ASCII, which decodes faster than UTF-8.
+    return f"data:{upload.content_type};base64,{base64.b64encode(upload.data).decode('ascii')}"
+
+async def upload_data_uri_to_fal(value: Optional[str]) -> Optional[str]:
+    """Uploads a base64 data URI to fal storage and returns its URL; anything else is returned unchanged."""
+    if not value or not value.startswith("data:"):
+        return value
+    try:
+        header, encoded = value.split(",", 1)
+        content_type = header[len("data:"):].split(";", 1)[0] or "application/octet-stream"
+        return await upload_bytes_to_fal(base64.b64decode(encoded), content_type)
+    except Exception as e:
+        logger.warning("Upload to fal.ai failed, sending inline data instead: %s", e)
+        return value
+
+async def stage_media_input(value: Any) -> Optional[str]:
+    """Returns a fal storage URL for raw media or a data URI (inline data if the upload fails); URLs pass through."""
+    if isinstance(value, MediaUpload):
+        try:
+            return await upload_bytes_to_fal(value.data, value.content_type)
+        except Exception as e:
+            logger.warning("Upload to fal.ai failed, sending inline data instead: %s", e)
+            return _data_uri(value)
+    return await upload_data_uri_to_fal(value)
+
+# The uploads each media type sends to fal.ai; the others are never uploaded.
+_MEDIA_INPUT_KEYS = {
+    "image": ("reference_image",),
+    "photo_carousel": ("reference_image",),
+    "video": ("video_init_image",),
+}
+
+async def stage_media_uploads(media_payload: Dict[str, Any], media_type: str) -> Dict[str, Any]:
+    """Moves the reference media media_type uses to fal storage so generation requests only carry URLs."""
+    staged = dict.fromkeys(media_payload) # Uploads this media type doesn't use are dropped
+    keys = [key for key in _MEDIA_INPUT_KEYS.get(media_type, ()) if media_payload.get(key)]
+    urls = await asyncio.gather(*[stage_media_input(media_payload[key]) for key in keys])
+    staged.update(zip(keys, urls))
+    return staged
+
+async def generate_image_with_fal(
     prompt: str, 
     constraints: Dict[str, Any],
     reference_image: Optional[str] = None
 ) -> str:
-    print(f"Generating image with fal.ai (nano-banana) prompt: {prompt[:50]}...")
+    logger.info("Generating image with fal.ai (nano-banana) prompt: %.50s...", prompt)
     
     arguments = {
         "prompt": prompt,
@@ -81,23 +429,19 @@ def generate_image_with_fal(
         arguments["image_input"] = [reference_image]
     
     try:
-        result = fal_client.subscribe(
-            "fal-ai/nano-banana",
-            arguments=arguments,
-            with_logs=True
-        )
+        result = await run_fal_job("fal-ai/nano-banana", arguments, "images")
         if 'images' in result and len(result['images']) > 0:
             return result['images'][0]['url']
         return str(result)
     except Exception as e:
         return f"Error generating image with fal.ai: {str(e)}"
 
-def generate_video_with_fal(
+async def generate_video_with_fal(
     prompt: str, 
     constraints: Dict[str, Any],
     init_image: Optional[str] = None
 ) -> str:
-    print(f"Generating video with fal.ai (veo3) prompt: {prompt[:50]}...")
+    logger.info("Generating video with fal.ai (veo3) prompt: %.50s...", prompt)
     
     arguments = {
         "prompt": prompt,
@@ -111,11 +455,7 @@ def generate_video_with_fal(
         arguments["image"] = init_image
 
     try:
-        result = fal_client.subscribe(
-            "fal-ai/veo3",
-            arguments=arguments,
-            with_logs=True
-        )
+        result = await run_fal_job("fal-ai/veo3", arguments, "video")
         if 'video' in result:
             return result['video']['url']
         return str(result)
@@ -127,17 +467,61 @@ def generate_video_with_fal(
 # ======================================================
 CONFIG_FILE = "platform_rules_config.json" # Assuming this is in the same directory
 
+@lru_cache(maxsize=4)
+def _load_rules_cached(mtime: float, path: str) -> Dict[str, Any]:
+    # Keyed on mtime so edits to the config file are picked up without a restart.
+    with open(path, "rb") as f: data = f.read()
+    return orjson.loads(data) if orjson else json.loads(data)
+
+# How often the request path re-stats the config file for edits; 0 checks on every call.
+RULES_CHECK_INTERVAL = float(os.environ.get("RULES_CHECK_INTERVAL", "2.0"))
+_config_stat: Tuple[float, Optional[float]] = (-math.inf, None) # (checked_at, mtime)
+
+def _config_mtime() -> Optional[float]:
+    """Returns the config file's mtime, or None if it is missing, re-statting at most every RULES_CHECK_INTERVAL seconds."""
+    global _config_stat
+    now = time.monotonic()
+    checked_at, mtime = _config_stat
+    if now - checked_at < RULES_CHECK_INTERVAL:
+        return mtime
+    try:
+        mtime = os.path.getmtime(CONFIG_FILE)
+    except FileNotFoundError:
+        mtime = None
+    _config_stat = (now, mtime)
+    return mtime
+
+def write_dummy_config() -> Dict[str, Any]:
+    logger.warning("%s not found. Creating a dummy one.", CONFIG_FILE)
+    dummy_config = {"PLATFORM_RULES": {"X": {"DEFAULT": {"content_type": "post", "objective": "engagement", "tone": "professional", "text_constraints": {"max_chars": 280}, "media_constraints": {"type": "optional"}}}}}
+    # Serialized straight to bytes, matching the binary read in _load_rules_cached.
+    data = orjson.dumps(dummy_config, option=orjson.OPT_INDENT_2) if orjson else json.dumps(dummy_config, ensure_ascii=False, indent=2).encode("utf-8")
+    with open(CONFIG_FILE, "wb") as f: f.write(data)
+    global _config_stat
+    _config_stat = (-math.inf, None) # Pick up the new file on the next call
+    return dummy_config
+
 def load_platform_rules() -> Dict[str, Any]:
-    if not os.path.exists(CONFIG_FILE):
-        dummy_config = {"PLATFORM_RULES": {"X": {"DEFAULT": {"content_type": "post", "objective": "engagement", "tone": "professional", "text_constraints": {"max_chars": 280}, "media_constraints": {"type": "optional"}}}}}
-        with open(CONFIG_FILE, "w") as f: json.dump(dummy_config, f)
-    with open(CONFIG_FILE, "r", encoding="utf-8") as f: return json.load(f)["PLATFORM_RULES"]
+    # The mtime doubles as the existence check.
+    mtime = _config_mtime()
+    if mtime is None:
+        return write_dummy_config()["PLATFORM_RULES"] # Just written; no need to read it back
+    return _load_rules_cached(mtime, CONFIG_FILE)["PLATFORM_RULES"]
+
+def reload_platform_rules() -> None:
+    """Drops the parsed rules so the next call re-reads the config, even if its mtime did not change."""
+    global _config_stat
+    _config_stat = (-math.inf, None)
+    _load_rules_cached.cache_clear()
+    _cached_plan.cache_clear()
 
 def deep_merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
-    result = copy.deepcopy(base)
+    # Builds fresh dicts only along merged paths and shares every other value with
+    # the (cached) rules, so the result must be treated as read-only.
+    result = dict(base)
     for k, v in override.items():
-        if k in result and isinstance(result[k], dict) and isinstance(v, dict): result[k] = deep_merge(result[k], v)
-        else: result[k] = copy.deepcopy(v)
+        if isinstance(result.get(k), dict) and isinstance(v, dict): result[k] = deep_merge(result[k], v)
+        else: result[k] = v
     return result
 
 def build_generation_plan(platform: str, intent: str) -> Dict[str, Any]:
@@ -149,13 +533,20 @@ def build_generation_plan(platform: str, intent: str) -> Dict[str, Any]:
     merged["_meta"] = {"platform": platform, "intent": intent}
     return merged
 
+# Media types a plan may produce, by the rule's media_constraints.type.
+ALLOWED_MEDIA_TYPES = {
+    "optional": ("image", "video"),
+    "image_or_short_video": ("image", "video"),
+    "image": ("image",),
+    "video": ("video",),
+    "photo_carousel": ("photo_carousel",),
+    "text_only": ("text_only",),
+}
+
 def normalize_plan(raw: Dict[str, Any], user_media_choice: Optional[str] = None) -> Dict[str, Any]:
     media = raw.get("media_constraints", {})
     text = raw.get("text_constraints", {})
-    raw_type = media.get("type")
-    if raw_type in ["optional", "image_or_short_video"]: allowed_types = ["image", "video"]
-    elif raw_type in ["video", "photo_carousel", "text_only"]: allowed_types = [raw_type]
-    else: allowed_types = []
+    allowed_types = list(ALLOWED_MEDIA_TYPES.get(media.get("type"), ()))
     selected_type = user_media_choice if user_media_choice in allowed_types else (allowed_types[0] if allowed_types else None)
     return {
         "platform": raw.get("platform"), "content_type": raw.get("content_type"), "objective": raw.get("objective"), "tone": raw.get("tone"),
@@ -171,6 +562,15 @@ def normalize_plan(raw: Dict[str, Any], user_media_choice: Optional[str] = None)
         "_meta": raw.get("_meta")
     }
 
+@lru_cache(maxsize=128)
+def _cached_plan(platform: str, intent: str, user_media_choice: Optional[str], rules_mtime: Optional[float]) -> Dict[str, Any]:
+    # rules_mtime is only part of the key, so editing the config yields fresh plans.
+    return normalize_plan(build_generation_plan(platform, intent), user_media_choice=user_media_choice)
+
+def get_generation_plan(platform: str, intent: str, user_media_choice: Optional[str] = None) -> Dict[str, Any]:
+    """Returns the normalized plan, shared between requests with the same inputs; treat it as read-only."""
+    return _cached_plan(platform, intent, user_media_choice, _config_mtime())
+
 # ======================================================
 # PROMPT TEMPLATES (from content_orchestrationfal.py)
 # ======================================================
@@ -321,25 +721,192 @@ Return only the generated {{ media_type }}.
 No explanations. No captions text unless explicitly required.
 """
 
+# The templates above are the readable source of truth; production rendering goes
+# through the plain-Python renderers below, which produce identical output without
+# a template engine on the request path. Set PROMPT_ENGINE=jinja to render the
+# templates themselves (e.g. while editing them) - jinja2 is only needed then.
+USE_JINJA_TEMPLATES = os.environ.get("PROMPT_ENGINE", "python").lower() == "jinja"
+
+if USE_JINJA_TEMPLATES:
+    from jinja2 import Environment
+    # Compiled once at import; rendering a compiled template skips lexing/parsing/codegen.
+    # Whitespace options stay at their defaults so the output matches the Python renderers.
+    _JINJA_ENV = Environment(autoescape=False, auto_reload=False)
+    _TEXT_TMPL = _JINJA_ENV.from_string(TEXT_PROMPT_TEMPLATE)
+    _MEDIA_TMPL = _JINJA_ENV.from_string(MEDIA_PROMPT_TEMPLATE)
+
+def _field_text(mapping: Any, key: str) -> str:
+    """Renders mapping[key] like a Jinja expression: str(value), or "" when the key is missing."""
+    if isinstance(mapping, dict) and key in mapping:
+        return str(mapping[key])
+    return ""
+
+def _render_text_prompt(
+    platform: Any,
+    content_type: Any,
+    objective: Any,
+    tone: Any,
+    text_constraints: Dict[str, Any]
+) -> str:
+    tc = text_constraints
+    parts = [f"""
+SYSTEM:
+You are a senior social media copywriter who specializes in {platform} {content_type} content.
+
+CONTEXT:
+You are writing a {content_type} post.
+Your success is measured by {objective}.
+The audience scrolls fast, so clarity and impact matter.
+
+YOUR MISSION:
+Write a single post that communicates the idea clearly, hooks the reader immediately,
+and feels native to {platform}.
+
+NON-NEGOTIABLE RULES:"""]
+    if tc.get("min_chars") and tc.get("max_chars"):
+        parts.append(f"- The final text must be between {tc['min_chars']} and {tc['max_chars']} characters.")
+    elif tc.get("max_chars"):
+        parts.append(f"- The final text must not exceed {tc['max_chars']} characters.")
+    if tc.get("max_words") is not None:
+        parts.append(f"- The final text must not exceed {tc['max_words']} words.")
+    if tc.get("max_emojis") is not None:
+        parts.append(f"- You may use at most {tc['max_emojis']} emoji.")
+    parts.append(f"- The tone must be {tone}.")
+    if tc.get("hook_first_50_chars"):
+        parts.append("- The first 50 characters must contain a strong hook.")
+    # In the template a missing key is "not none" and falsy, i.e. it renders as False.
+    allow_hashtags = tc.get("allow_hashtags", False)
+    if allow_hashtags is not None:
+        parts.append("- Hashtags are allowed if they fit naturally." if allow_hashtags else "- Hashtags are NOT allowed.")
+    allow_mentions = tc.get("allow_mentions", False)
+    if allow_mentions is not None:
+        parts.append("- Mentions are allowed if relevant." if allow_mentions else "- Mentions are NOT allowed.")
+    parts.append("""
+HOW TO WORK:
+- Use ONLY the information provided in the USER PROVIDED DATA section.
+- Do NOT invent facts, features, or claims.
+- Write naturally, as a human copywriter would.
+
+FINAL OUTPUT:
+Return only the final post text.
+No explanations. No formatting.""")
+    return "\n".join(parts)
+
+def _append_image_rules(parts: List[str], mc: Dict[str, Any]) -> None:
+    image = mc.get("image") or {}
+    parts.append(f"- Aspect ratio: {_field_text(image, 'aspect_ratio')}")
+    parts.append(f"- Minimum resolution: {_field_text(image, 'min_resolution')}")
+    if image.get("max_file_size_mb"):
+        parts.append(f"- Maximum file size: {image['max_file_size_mb']} MB")
+    parts.append("- Text overlays are allowed." if image.get("text_overlay_allowed") else "- Text overlays are NOT allowed.")
+    parts.append("- Branding is required." if image.get("branding_required") else "- Branding is not required.")
+    if image.get("branding_position"):
+        parts.append(f"- Branding position: {image['branding_position']}")
+
+def _append_video_rules(parts: List[str], mc: Dict[str, Any]) -> None:
+    video = mc.get("video") or {}
+    if video.get("max_duration_sec"):
+        parts.append(f"- Max duration: {video['max_duration_sec']} seconds")
+    if video.get("aspect_ratio"):
+        parts.append(f"- Aspect ratio: {video['aspect_ratio']}")
+    elif video.get("aspect_ratios"):
+        parts.append(f"- Allowed aspect ratios: {video['aspect_ratios']}")
+    parts.append("- Captions are required." if video.get("captions_required") else "- Captions are optional.")
+    if video.get("hook_first_sec"):
+        parts.append(f"- The first {video['hook_first_sec']} seconds must contain a strong hook.")
+    if video.get("branding_first_sec"):
+        parts.append(f"- Branding must appear within the first {video['branding_first_sec']} seconds.")
+
+def _append_carousel_rules(parts: List[str], mc: Dict[str, Any]) -> None:
+    parts.append("- This is a multi-image carousel.")
+    image_count = mc.get("image_count")
+    if image_count:
+        parts.append(f"- Number of images: between {_field_text(image_count, 'min')} and {_field_text(image_count, 'max')}.")
+    if mc.get("aspect_ratio"):
+        parts.append(f"- Aspect ratio: {mc['aspect_ratio']}.")
+    if mc.get("safe_zone_required"):
+        parts.append("- Safe zones must be respected.")
+    if mc.get("ugc_style"):
+        parts.append("- The visual style should feel like authentic UGC.")
+    if mc.get("recommended_use_cases"):
+        parts.append(f"- Recommended use cases: {mc['recommended_use_cases']}.")
+
+# TECHNICAL CONSTRAINTS lines per media type, appended by _render_media_prompt.
+_MEDIA_RULE_RENDERERS = {
+    "image": _append_image_rules,
+    "video": _append_video_rules,
+    "photo_carousel": _append_carousel_rules,
+}
+
+def _render_media_prompt(
+    platform: Any,
+    content_type: Any,
+    objective: Any,
+    media_type: str,
+    media_constraints: Dict[str, Any]
+) -> str:
+    mc = media_constraints
+    parts = [f"""
+SYSTEM:
+You are a senior creative director producing media content for {platform}.
+
+CONTEXT:
+This media asset supports a {content_type} post.
+The primary goal is {objective}.
+The content must feel native to {platform} and optimized for fast-scrolling users.
+
+MEDIA TYPE:
+{media_type}
+
+TECHNICAL CONSTRAINTS (STRICT):"""]
+    append_rules = _MEDIA_RULE_RENDERERS.get(media_type)
+    if append_rules:
+        append_rules(parts, mc)
+    parts.append("""
+CREATIVE DIRECTION:
+- The visual should clearly communicate the core idea.
+- The message must be understandable without reading additional text.
+- Avoid clutter, unnecessary elements, or visual noise.""")
+    if media_type == "video":
+        parts.append("- Prioritize clarity in the first few seconds.")
+    parts.append(f"""
+USAGE RULES:
+- Use ONLY the information provided in the USER PROVIDED DATA section.
+- Do NOT introduce new concepts, claims, or visual elements not implied by the data.
+- Follow all constraints exactly as listed above.
+
+FINAL OUTPUT:
+Return only the generated {media_type}.
+No explanations. No captions text unless explicitly required.""")
+    return "\n".join(parts)
+
 def build_text_prompt(plan: Dict[str, Any]) -> str:
-    return Template(TEXT_PROMPT_TEMPLATE).render(
-        platform=plan["platform"],
-        objective=plan["objective"],
-        content_type=plan["content_type"],
-        tone=plan["tone"],
-        text_constraints=plan["text_constraints"]
+    if USE_JINJA_TEMPLATES:
+        return _TEXT_TMPL.render(
+            platform=plan["platform"],
+            objective=plan["objective"],
+            content_type=plan["content_type"],
+            tone=plan["tone"],
+            text_constraints=plan["text_constraints"]
+        )
+    return _render_text_prompt(
+        plan["platform"], plan["content_type"], plan["objective"], plan["tone"], plan["text_constraints"]
     )
 
 def build_media_prompt(plan: Dict[str, Any]) -> Optional[str]:
     media_type = plan["media_constraints"]["selected_type"]
     if not media_type or media_type == "text_only":
         return None
-    return Template(MEDIA_PROMPT_TEMPLATE).render(
-        platform=plan["platform"],
-        content_type=plan["content_type"],
-        objective=plan["objective"],
-        media_type=media_type,
-        media_constraints=plan["media_constraints"]
+    if USE_JINJA_TEMPLATES:
+        return _MEDIA_TMPL.render(
+            platform=plan["platform"],
+            content_type=plan["content_type"],
+            objective=plan["objective"],
+            media_type=media_type,
+            media_constraints=plan["media_constraints"]
+        )
+    return _render_media_prompt(
+        plan["platform"], plan["content_type"], plan["objective"], media_type, plan["media_constraints"]
     )
 
 def build_text_user_data_block(user_inputs: Dict[str, Any]) -> str:
@@ -365,10 +932,53 @@ RULES
 - Do NOT invent missing information
 """
 
+# Optional sections of the media user-data block, added only for files that were uploaded.
+_VISUAL_REFERENCE_SECTION = """
+VISUAL REFERENCE:
+Use the attached image(s) as visual/style reference.
+"""
+_INITIAL_FRAME_SECTION = """
+INITIAL FRAME:
+Use the attached image as the starting frame.
+"""
+
+# The block with both optional sections left empty: the common case with no uploads.
+_MEDIA_USER_DATA_NO_UPLOADS = """
+====================
+USER PROVIDED DATA
+====================
+
+CORE IDEA:
+{content_idea}
+
+CONTEXT / DESCRIPTION:
+{description}
+
+
+
+
+
+====================
+RULES
+====================
+- All fields above are provided by the user
+- Use them as the sole source of truth
+- Do NOT invent visual elements not implied by the data
+"""
+
 def build_media_user_data_block(
     user_inputs: Dict[str, Any],
     uploaded_files: Dict[str, Any]
 ) -> str:
+    has_reference = uploaded_files.get("reference_image")
+    has_initial_frame = uploaded_files.get("video_init_image")
+    if not has_reference and not has_initial_frame:
+        return _MEDIA_USER_DATA_NO_UPLOADS.format(
+            content_idea=user_inputs.get("content_idea"),
+            description=user_inputs.get("description")
+        )
+    reference_section = _VISUAL_REFERENCE_SECTION if has_reference else ""
+    initial_frame_section = _INITIAL_FRAME_SECTION if has_initial_frame else ""
     return f"""
 ====================
 USER PROVIDED DATA
@@ -380,15 +990,9 @@ CORE IDEA:
 CONTEXT / DESCRIPTION:
 {user_inputs.get("description")}
 
-{f"""
-VISUAL REFERENCE:
-Use the attached image(s) as visual/style reference.
-""" if uploaded_files.get("reference_image") else ""}
+{reference_section}
 
-{f"""
-INITIAL FRAME:
-Use the attached image as the starting frame.
-""" if uploaded_files.get("video_init_image") else ""}
+{initial_frame_section}
 
 ====================
 RULES
@@ -398,163 +1002,327 @@ RULES
 - Do NOT invent visual elements not implied by the data
 """
 
-def build_final_model_input(
+# Runs of blank lines (left by empty template sections and the joins) cost input
+# tokens without telling the model anything.
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+def tighten_prompt(text: str) -> str:
+    """Collapses consecutive blank lines into one and strips leading/trailing whitespace."""
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+def _model_input(prompt: str, user_data_block: str) -> str:
+    """Joins an instruction prompt and its user-data block into one tightened model input."""
+    return tighten_prompt("\n\n".join((prompt, user_data_block)))
+
+def build_media_model_input(
     plan: Dict[str, Any],
     user_inputs: Dict[str, Any],
     uploaded_files: Dict[str, Any]
-) -> Dict[str, Any]:
-    text_prompt = build_text_prompt(plan)
+) -> Optional[str]:
     media_prompt = build_media_prompt(plan)
-    text_user_data = build_text_user_data_block(user_inputs)
-    media_user_data = build_media_user_data_block(user_inputs, uploaded_files)
+    if not media_prompt:
+        return None
+    return _model_input(media_prompt, build_media_user_data_block(user_inputs, uploaded_files))
+
+def build_all_prompts(
+    plan: Dict[str, Any],
+    user_inputs: Dict[str, Any],
+    uploaded_files: Dict[str, Any],
+    build_media: bool = True
+) -> Dict[str, Optional[str]]:
+    """Builds the text and media model inputs for a plan; build_media=False skips the media one."""
+    text_prompt = build_text_prompt(plan)
+    media_prompt = build_media_prompt(plan) if build_media else None
+    text_model_input = _model_input(text_prompt, build_text_user_data_block(user_inputs))
+    if not media_prompt:
+        return {"text_model_input": text_model_input, "media_model_input": None}
     return {
-        "text_model_input": f"{text_prompt}\n\n{text_user_data}",
-        "media_model_input": (f"{media_prompt}\n\n{media_user_data}" if media_prompt else None),
-        "media_payload": {
-            "reference_image": uploaded_files.get("reference_image"),
-            "video_init_image": uploaded_files.get("video_init_image")
-        },
+        "text_model_input": text_model_input,
+        "media_model_input": _model_input(media_prompt, build_media_user_data_block(user_inputs, uploaded_files))
+    }
+
+def _media_payload(uploaded_files: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "reference_image": uploaded_files.get("reference_image"),
+        "video_init_image": uploaded_files.get("video_init_image")
+    }
+
+def build_final_model_input(
+    plan: Dict[str, Any],
+    user_inputs: Dict[str, Any],
+    uploaded_files: Dict[str, Any],
+    build_media: bool = True
+) -> Dict[str, Any]:
+    return {
+        **build_all_prompts(plan, user_inputs, uploaded_files, build_media),
+        "media_payload": _media_payload(uploaded_files),
         "generation_plan": plan
     }
 
+def build_final_model_inputs(
+    plans: List[Dict[str, Any]],
+    user_inputs_list: List[Dict[str, Any]],
+    uploaded_files_list: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Bulk version of build_final_model_input (e.g. for A/B variants). The instruction
+    prompts are rendered once per distinct plan object; plans from get_generation_plan
+    are shared, so variants of one platform/intent reuse a single render and only
+    their user-data blocks are built per item. The three lists must be the same
+    length; a mismatch raises ValueError.
+    """
+    prompts: Dict[int, Tuple[str, Optional[str]]] = {}
+    results = []
+    for plan, user_inputs, uploaded_files in zip(plans, user_inputs_list, uploaded_files_list, strict=True):
+        # The plans list keeps every plan alive, so id() is stable for this call.
+        rendered = prompts.get(id(plan))
+        if rendered is None:
+            rendered = prompts[id(plan)] = (build_text_prompt(plan), build_media_prompt(plan))
+        text_prompt, media_prompt = rendered
+        results.append({
+            "text_model_input": _model_input(text_prompt, build_text_user_data_block(user_inputs)),
+            "media_model_input": (
+                _model_input(media_prompt, build_media_user_data_block(user_inputs, uploaded_files))
+                if media_prompt else None
+            ),
+            "media_payload": _media_payload(uploaded_files),
+            "generation_plan": plan
+        })
+    return results
+
 # ======================================================
 # LangGraph Nodes
 # ======================================================
 
+def media_type_to_produce(plan: Dict[str, Any]) -> Optional[str]:
+    """The plan's selected media type, or None when the post is text only."""
+    media_type = plan["media_constraints"].get("selected_type")
+    return media_type if media_type and media_type != "text_only" else None
+
 def planner_node(state: AgentState) -> AgentState:
-    print("--- Node: Planner ---")
+    logger.debug("--- Node: Planner ---")
     try:
-        raw_plan = build_generation_plan(state["platform"], state["intent"])
-        plan = normalize_plan(raw_plan, user_media_choice=state["user_media_choice"])
+        plan = get_generation_plan(state["platform"], state["intent"], state["user_media_choice"])
         return {"generation_plan": plan, "status": "plan_generated", "errors": []}
     except Exception as e:
         return {"errors": state.get("errors", []) + [f"Planner failed: {str(e)}"], "status": "failed"}
 
 def prompt_engineer_node(state: AgentState) -> AgentState:
-    print("--- Node: Prompt Engineer ---")
+    logger.debug("--- Node: Prompt Engineer ---")
     try:
+        # The default graph gets its visual prompt from the copywriter's combined
+        # call, so the media brief is only rendered upfront for the parallel graph.
         final_input = build_final_model_input(
             state["generation_plan"],
             state["user_inputs"],
-            state["uploaded_files"]
+            state["uploaded_files"],
+            build_media=PARALLEL_MEDIA
         )
         return {
             "text_model_input": final_input["text_model_input"],
+            "media_model_input": final_input.get("media_model_input"),
             "media_payload": final_input.get("media_payload", {}),
-            "visual_prompt": final_input.get("media_model_input"), # Renamed for clarity
+            "visual_prompt": None, # Filled in by the copywriter or the visual refiner
             "status": "prompts_engineered", 
             "errors": []
         }
     except Exception as e:
         return {"errors": state.get("errors", []) + [f"Prompt Engineer failed: {str(e)}"], "status": "failed"}
 
-def copywriter_node(state: AgentState) -> AgentState:
-    print("--- Node: Copywriter ---")
+async def copywriter_node(state: AgentState) -> AgentState:
+    logger.debug("--- Node: Copywriter ---")
     try:
-        if not state.get("text_model_input"):
+        text_model_input = state.get("text_model_input")
+        if not text_model_input:
             raise ValueError("Text model input missing.")
-        
-        post_text = generate_text_with_gemini(state["text_model_input"])
+
+        media_type = media_type_to_produce(state["generation_plan"])
+        if media_type:
+            # Upload reference media while Gemini is still decoding, so the media
+            # producer starts from ready URLs instead of pushing inline bytes.
+            combined, media_payload = await asyncio.gather(
+                generate_post_and_visual_prompt(text_model_input, media_type),
+                stage_media_uploads(state.get("media_payload") or {}, media_type)
+            )
+            if combined:
+                post_text, visual_prompt = combined
+                return {"generated_text": post_text, "visual_prompt": visual_prompt, "media_payload": media_payload, "status": "text_generated", "errors": []}
+            # The reply was unusable (the call itself succeeded), so fall back to two
+            # independent calls: the post text, and a generic visual prompt drafted from
+            # the media brief. If the draft fails too, the visual refiner derives the
+            # prompt from the post text.
+            media_model_input = state.get("media_model_input") or build_media_model_input(
+                state["generation_plan"], state["user_inputs"], state["uploaded_files"]
+            )
+            post_text, visual_prompt = await asyncio.gather(
+                generate_text_with_gemini(text_model_input),
+                draft_visual_prompt(media_model_input, media_type)
+            )
+            return {"generated_text": post_text, "visual_prompt": visual_prompt, "media_payload": media_payload, "status": "text_generated", "errors": []}
+
+        post_text = await generate_text_with_gemini(text_model_input)
         return {"generated_text": post_text, "status": "text_generated", "errors": []}
     except Exception as e:
         return {"errors": state.get("errors", []) + [f"Copywriter failed: {str(e)}"], "status": "failed"}
 
-def visual_refiner_node(state: AgentState) -> AgentState:
-    print("--- Node: Visual Refiner ---")
+async def visual_refiner_node(state: AgentState) -> AgentState:
+    logger.debug("--- Node: Visual Refiner ---")
     try:
-        media_type = state["generation_plan"]["media_constraints"].get("selected_type")
-        if not media_type or media_type == "text_only":
+        media_type = media_type_to_produce(state["generation_plan"])
+        if not media_type:
             return {"visual_prompt": None, "status": "visual_refiner_skipped", "errors": []}
 
-        if not state.get("generated_text"):
+        if state.get("visual_prompt"):
+            # Already produced alongside the post text by the copywriter.
+            return {"status": "visual_prompt_refined", "errors": []}
+
+        generated_text = state.get("generated_text")
+        if not generated_text:
             raise ValueError("Generated text missing for media prompt refinement.")
 
         # Refine visual prompt using generated text
-        visual_prompt_request = f"Based on this social media post: '{state['generated_text']}', create a detailed visual prompt for an {media_type} generation. Focus on style, lighting, and composition. Return only the prompt."
-        visual_prompt = generate_text_with_gemini(visual_prompt_request)
-        print(f"Refined Visual Prompt: {visual_prompt[:100]}...")
+        visual_prompt = await refine_visual_prompt(generated_text, media_type)
+        logger.debug("Refined Visual Prompt: %.100s...", visual_prompt)
         return {"visual_prompt": visual_prompt, "status": "visual_prompt_refined", "errors": []}
     except Exception as e:
         return {"errors": state.get("errors", []) + [f"Visual Refiner failed: {str(e)}"], "status": "failed"}
 
-def media_producer_node(state: AgentState) -> AgentState:
-    print("--- Node: Media Producer ---")
+async def media_producer_node(state: AgentState) -> AgentState:
+    logger.debug("--- Node: Media Producer ---")
     try:
-        media_type = state["generation_plan"]["media_constraints"].get("selected_type")
-        if not media_type or media_type == "text_only":
+        plan = state["generation_plan"]
+        media_type = media_type_to_produce(plan)
+        if not media_type:
             return {"generated_media_url": None, "status": "media_producer_skipped", "errors": []}
+        constraints = plan["media_constraints"]
 
-        if not state.get("visual_prompt"):
+        visual_prompt = state.get("visual_prompt")
+        if not visual_prompt:
             raise ValueError("Visual prompt missing for media generation.")
 
         media_result = None
-        constraints = state["generation_plan"]["media_constraints"]
+        # Normally already staged by the copywriter, in which case the URLs come back unchanged.
+        media_inputs = await stage_media_uploads(state.get("media_payload") or state["uploaded_files"], media_type)
         
         if media_type == "image":
-            media_result = generate_image_with_fal(
-                prompt=state["visual_prompt"],
+            media_result = await generate_image_with_fal(
+                prompt=visual_prompt,
                 constraints=constraints.get("image", {}),
-                reference_image=state["uploaded_files"].get("reference_image")
+                reference_image=media_inputs.get("reference_image")
             )
         elif media_type == "video":
-            media_result = generate_video_with_fal(
-                prompt=state["visual_prompt"],
+            media_result = await generate_video_with_fal(
+                prompt=visual_prompt,
                 constraints=constraints.get("video", {}),
-                init_image=state["uploaded_files"].get("video_init_image")
+                init_image=media_inputs.get("video_init_image")
             )
         elif media_type == "photo_carousel":
-            print("Generating Carousel Images...")
-            carousel_urls = []
+            logger.info("Generating Carousel Images...")
             image_count_constraints = constraints.get("image_count", {})
             min_images = image_count_constraints.get("min", 1) if isinstance(image_count_constraints, dict) else 1
-            for i in range(min_images):
-                url = generate_image_with_fal(
-                    prompt=f"{state["visual_prompt"]} - Slide {i+1}",
-                    constraints=constraints.get("image", {}),
-                    reference_image=state["uploaded_files"].get("reference_image")
+            image_constraints = constraints.get("image", {})
+            reference_image = media_inputs.get("reference_image")
+
+            # Slides are independent remote generations, so dispatch them all at once
+            # and wait on the slowest one instead of paying N sequential round-trips.
+            # _submit_fal_job caps how many actually run at once across all requests.
+            carousel_urls = await asyncio.gather(*[
+                generate_image_with_fal(
+                    prompt=f"{visual_prompt} - Slide {i+1}",
+                    constraints=image_constraints,
+                    reference_image=reference_image
                 )
-                carousel_urls.append(url)
-            media_result = carousel_urls
+                for i in range(min_images)
+            ])
+            media_result = list(carousel_urls)
             
         return {"generated_media_url": media_result, "status": "media_produced", "errors": []}
     except Exception as e:
         return {"errors": state.get("errors", []) + [f"Media Producer failed: {str(e)}"], "status": "failed"}
 
-# ======================================================
-# Graph Definition
-# ======================================================
+# With PARALLEL_MEDIA=1 the graph skips the serial copywriter -> visual refiner ->
+# media producer chain: the visual prompt is drafted from the media brief instead
+# of the finished post, so text and media generation overlap. The media is then
+# not tailored to the exact post wording, hence opt-in.
+PARALLEL_MEDIA = os.environ.get("PARALLEL_MEDIA", "0") == "1"
+
+async def text_and_media_node(state: AgentState) -> AgentState:
+    logger.debug("--- Node: Text & Media (parallel) ---")
+    try:
+        text_model_input = state.get("text_model_input")
+        if not text_model_input:
+            raise ValueError("Text model input missing.")
 
-workflow = StateGraph(AgentState)
+        media_type = media_type_to_produce(state["generation_plan"])
+        if not media_type:
+            post_text = await generate_text_with_gemini(text_model_input)
+            return {"generated_text": post_text, "visual_prompt": None, "generated_media_url": None, "status": "media_producer_skipped", "errors": []}
 
-# Add nodes
-workflow.add_node("planner", planner_node)
-workflow.add_node("prompt_engineer", prompt_engineer_node)
-workflow.add_node("copywriter", copywriter_node)
-workflow.add_node("visual_refiner", visual_refiner_node)
-workflow.add_node("media_producer", media_producer_node)
+        async def media_branch() -> AgentState:
+            visual_prompt, media_payload = await asyncio.gather(
+                draft_visual_prompt(state.get("media_model_input"), media_type),
+                stage_media_uploads(state.get("media_payload") or {}, media_type)
+            )
+            update = await media_producer_node({**state, "visual_prompt": visual_prompt, "media_payload": media_payload})
+            return {**update, "visual_prompt": visual_prompt, "media_payload": media_payload}
 
-# Set entry point
-workflow.set_entry_point("planner")
+        post_text, media_update = await asyncio.gather(
+            generate_text_with_gemini(text_model_input),
+            media_branch()
+        )
+        return {**media_update, "generated_text": post_text}
+    except Exception as e:
+        return {"errors": state.get("errors", []) + [f"Text & Media failed: {str(e)}"], "status": "failed"}
 
-# Add edges
-workflow.add_edge("planner", "prompt_engineer")
-workflow.add_edge("prompt_engineer", "copywriter")
-workflow.add_edge("copywriter", "visual_refiner")
-workflow.add_edge("visual_refiner", "media_producer")
-workflow.add_edge("media_producer", END)
+# ======================================================
+# Graph Definition
+# ======================================================
 
-# Compile the graph
-app = workflow.compile()
+@cache
+def get_workflow_app() -> Any:
+    """Builds and compiles the LangGraph workflow once, on first use."""
+    from langgraph.graph import StateGraph, END
+
+    workflow = StateGraph(AgentState)
+
+    # Add nodes
+    workflow.add_node("planner", planner_node)
+    workflow.add_node("prompt_engineer", prompt_engineer_node)
+    if PARALLEL_MEDIA:
+        workflow.add_node("text_and_media", text_and_media_node)
+    else:
+        workflow.add_node("copywriter", copywriter_node)
+        workflow.add_node("visual_refiner", visual_refiner_node)
+        workflow.add_node("media_producer", media_producer_node)
+
+    # Set entry point
+    workflow.set_entry_point("planner")
+
+    # Add edges
+    workflow.add_edge("planner", "prompt_engineer")
+    if PARALLEL_MEDIA:
+        workflow.add_edge("prompt_engineer", "text_and_media")
+        workflow.add_edge("text_and_media", END)
+    else:
+        workflow.add_edge("prompt_engineer", "copywriter")
+        workflow.add_edge("copywriter", "visual_refiner")
+        workflow.add_edge("visual_refiner", "media_producer")
+        workflow.add_edge("media_producer", END)
+
+    # Compile the graph
+    return workflow.compile()
+
+def __getattr__(name: str) -> Any:
+    # Keeps `from content_orchestrationfal import app` working while deferring the build.
+    if name == "app":
+        return get_workflow_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ======================================================
 # Demo Run
 # ======================================================
-if __name__ == "__main__":
-    # Ensure platform_rules_config.json exists for the demo
-    if not os.path.exists(CONFIG_FILE):
-        print(f"Warning: {CONFIG_FILE} not found. Creating a dummy one.")
-        dummy_config = {"PLATFORM_RULES": {"X": {"DEFAULT": {"content_type": "post", "objective": "engagement", "tone": "professional", "text_constraints": {"max_chars": 280}, "media_constraints": {"type": "optional"}}}}}
-        with open(CONFIG_FILE, "w") as f: json.dump(dummy_config, f)
+async def run_demo() -> None:
+    app = get_workflow_app()
 
     # Example User Inputs for X (Image)
     user_inputs_x = {
@@ -565,7 +1333,7 @@ if __name__ == "__main__":
     uploaded_files_x = {"reference_image": None, "video_init_image": None}
 
     print("\n--- Running LangGraph Agent for X (Image) ---")
-    final_state_x = app.invoke({
+    final_state_x = await app.ainvoke({
         "platform": "X",
         "intent": "PAID_AD", 
         "user_inputs": user_inputs_x,
@@ -574,9 +1342,9 @@ if __name__ == "__main__":
         "errors": []
     })
     print("\n--- Final State for X (Image) ---")
-    print(f"Generated Text: {final_state_x.get("generated_text")}")
-    print(f"Generated Media URL: {final_state_x.get("generated_media_url")}")
-    print(f"Errors: {final_state_x.get("errors")}")
+    print(f"Generated Text: {final_state_x.get('generated_text')}")
+    print(f"Generated Media URL: {final_state_x.get('generated_media_url')}")
+    print(f"Errors: {final_state_x.get('errors')}")
 
     # Example User Inputs for TikTok (Video)
     user_inputs_tiktok = {
@@ -587,7 +1355,7 @@ if __name__ == "__main__":
     uploaded_files_tiktok = {"reference_image": None, "video_init_image": None}
 
     print("\n--- Running LangGraph Agent for TikTok (Video) ---")
-    final_state_tiktok = app.invoke({
+    final_state_tiktok = await app.ainvoke({
         "platform": "TikTok",
         "intent": "ORGANIC_PROMOTION", 
         "user_inputs": user_inputs_tiktok,
@@ -596,9 +1364,13 @@ if __name__ == "__main__":
         "errors": []
     })
     print("\n--- Final State for TikTok (Video) ---")
-    print(f"Generated Text: {final_state_tiktok.get("generated_text")}")
-    print(f"Generated Media URL: {final_state_tiktok.get("generated_media_url")}")
-    print(f"Errors: {final_state_tiktok.get("errors")}")
+    print(f"Generated Text: {final_state_tiktok.get('generated_text')}")
+    print(f"Generated Media URL: {final_state_tiktok.get('generated_media_url')}")
+    print(f"Errors: {final_state_tiktok.get('errors')}")
 
-   
+if __name__ == "__main__":
+    setup_logging()
+    # load_platform_rules creates a dummy platform_rules_config.json if it is missing.
 
+    # Both runs share one event loop, and with it the pooled fal.ai connections.
+    asyncio.run(run_demo())
@@ -2,8 +2,9 @@ from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
-import base64
+from typing import Optional, List, Union
+from pydantic import BaseModel
+import logging
 import os
 import uvicorn
 import shutil
@@ -11,13 +12,16 @@ from pathlib import Path
 
 # Import the LangGraph workflow from the existing script
 try:
-    from content_orchestrationfal import app as workflow_app
+    from content_orchestrationfal import app as workflow_app, setup_logging, MediaUpload
+    setup_logging()
 except ImportError as e:
     print(f"Error importing content_orchestrationfal: {e}")
     # Fallback for testing without the actual script if needed, 
     # but in production this should fail or be handled.
     workflow_app = None
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Content Orchestration Agent")
 
 # CORS (allow all for simplicity in this demo)
@@ -36,20 +40,24 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def read_index():
     return FileResponse("static/index.html")
 
-def file_to_data_uri(file: UploadFile) -> str:
-    """Helper to convert uploaded file to data URI for Fal.ai"""
+async def read_upload(file: UploadFile) -> Optional["MediaUpload"]:
+    """Helper to pass an uploaded file's raw bytes to the workflow, which uploads them to Fal.ai only if the media uses them"""
     if not file:
         return None
     try:
-        contents = file.file.read()
-        encoded = base64.b64encode(contents).decode("utf-8")
-        media_type = file.content_type or "application/octet-stream"
-        return f"data:{media_type};base64,{encoded}"
+        return MediaUpload(await file.read(), file.content_type or "application/octet-stream")
     except Exception as e:
-        print(f"Error processing file {file.filename}: {e}")
+        logger.warning("Error processing file %s: %s", file.filename, e)
         return None
 
-@app.post("/generate")
+class GenerateResponse(BaseModel):
+    # Declaring the response model lets FastAPI serialize straight to JSON bytes via Pydantic.
+    status: str
+    generated_text: Optional[str] = None
+    generated_media_url: Union[str, List[str], None] = None # A list of slide URLs for carousels
+    errors: List[str] = []
+
+@app.post("/generate", response_model=GenerateResponse)
 async def generate_content(
     platform: str = Form(...),
     intent: str = Form(...),
@@ -70,17 +78,11 @@ async def generate_content(
         "reference_text": reference_text or ""
     }
 
-    # Process files
+    # Process files (staged to fal storage inside the graph, overlapping text generation)
     uploaded_files = {
-        "reference_image": None,
-        "video_init_image": None
+        "reference_image": await read_upload(reference_image),
+        "video_init_image": await read_upload(video_init_image)
     }
-    
-    if reference_image:
-        uploaded_files["reference_image"] = file_to_data_uri(reference_image)
-    
-    if video_init_image:
-        uploaded_files["video_init_image"] = file_to_data_uri(video_init_image)
 
     # Initial state for LangGraph
     initial_state = {
@@ -94,7 +96,7 @@ async def generate_content(
 
     try:
         # Invoke the LangGraph workflow
-        final_state = workflow_app.invoke(initial_state)
+        final_state = await workflow_app.ainvoke(initial_state)
         
         return {
             "status": "success",
@@ -0,0 +1,54 @@
+"""
+The Gemini response cache must only ever hold usable replies: an empty or blocked
+reply has to reach the API again on the next call instead of being replayed.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import content_orchestrationfal as orchestration
+
+class FakeGemini:
+    """Stands in for genai.Client; streams the queued replies' chunks and counts the calls."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+        self.aio = SimpleNamespace(models=self)
+
+    async def generate_content_stream(self, **kwargs):
+        self.calls += 1
+        chunks = self.replies.pop(0)
+
+        async def stream():
+            for text in chunks:
+                yield SimpleNamespace(text=text)
+        return stream()
+
+@pytest.fixture
+def gemini(monkeypatch):
+    def install(*replies):
+        client = FakeGemini(*replies)
+        monkeypatch.setattr(orchestration, "get_gemini_client", lambda: client)
+        return client
+    monkeypatch.setattr(orchestration, "_gemini_cache", orchestration.OrderedDict())
+    return install
+
+def test_reply_is_cached(gemini):
+    client = gemini(["Hello", " world "])
+    assert asyncio.run(orchestration._generate_text("prompt")) == "Hello world"
+    assert asyncio.run(orchestration._generate_text("prompt")) == "Hello world"
+    assert client.calls == 1
+
+def test_empty_reply_is_not_cached(gemini):
+    client = gemini([None, None], ["Retried"])
+    with pytest.raises(orchestration.EmptyResponseError):
+        asyncio.run(orchestration._generate_text("prompt"))
+    assert asyncio.run(orchestration._generate_text("prompt")) == "Retried"
+    assert client.calls == 2
+
+def test_empty_reply_is_an_error_for_callers(gemini):
+    gemini([], [" "])
+    assert asyncio.run(orchestration.generate_text_with_gemini("prompt")).startswith("Error generating text with Gemini")
+    assert asyncio.run(orchestration.draft_visual_prompt("brief", "image")) is None
@@ -0,0 +1,47 @@
+"""
+build_final_model_inputs renders each distinct plan once and reuses it across items,
+so its output must still equal a per-item build_final_model_input loop.
+"""
+import pytest
+
+import content_orchestrationfal as orchestration
+
+def _plan(media_type, user_media_choice=None):
+    raw = {
+        "platform": "TikTok", "content_type": "video", "objective": "reach", "tone": "playful",
+        "text_constraints": {"max_chars": 150, "max_emojis": 2, "allow_hashtags": True},
+        "media_constraints": {
+            "type": media_type,
+            "image": {"aspect_ratio": "9:16", "min_resolution": "1080x1920"},
+            "video": {"max_duration_sec": 8, "aspect_ratio": "9:16", "hook_first_sec": 2},
+            "image_count": {"min": 3, "max": 5},
+        },
+    }
+    return orchestration.normalize_plan(raw, user_media_choice)
+
+def test_bulk_matches_per_item_build():
+    image_plan = _plan("image")
+    plans = [image_plan, _plan("optional", "video"), image_plan, _plan("photo_carousel"), _plan("text_only"), image_plan]
+    user_inputs_list = [
+        {"content_idea": f"Idea {i}", "description": f"Description {i}", "reference_text": "Ref" if i % 2 else None}
+        for i in range(len(plans))
+    ]
+    uploaded_files_list = [
+        {"reference_image": "https://fal.media/ref.png" if i % 2 else None, "video_init_image": "https://fal.media/frame.png" if i % 3 == 0 else None}
+        for i in range(len(plans))
+    ]
+    expected = [
+        orchestration.build_final_model_input(plan, user_inputs, uploaded_files)
+        for plan, user_inputs, uploaded_files in zip(plans, user_inputs_list, uploaded_files_list)
+    ]
+    assert orchestration.build_final_model_inputs(plans, user_inputs_list, uploaded_files_list) == expected
+
+@pytest.mark.parametrize("lengths", [(2, 1, 1), (1, 2, 1), (1, 1, 2), (0, 1, 0)])
+def test_bulk_rejects_mismatched_lengths(lengths):
+    n_plans, n_inputs, n_files = lengths
+    with pytest.raises(ValueError):
+        orchestration.build_final_model_inputs(
+            [_plan("image")] * n_plans,
+            [{"content_idea": "Idea", "description": "Description"}] * n_inputs,
+            [{}] * n_files,
+        )
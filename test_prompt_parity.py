@@ -0,0 +1,54 @@
+"""
+The built-in prompt renderers (the default PROMPT_ENGINE) must produce exactly what
+the Jinja templates render, so switching engines never changes what the models see.
+"""
+import random
+
+import pytest
+
+jinja2 = pytest.importorskip("jinja2")
+
+import content_orchestrationfal as orchestration
+
+_ENV = jinja2.Environment(autoescape=False, auto_reload=False)
+_TEXT_TMPL = _ENV.from_string(orchestration.TEXT_PROMPT_TEMPLATE)
+_MEDIA_TMPL = _ENV.from_string(orchestration.MEDIA_PROMPT_TEMPLATE)
+
+_MISSING = object()
+# Values the rules config can hold: absent, null, falsy, truthy, numbers, text and lists.
+_VALUES = [_MISSING, None, False, True, 0, 3, 280, "", "9:16", ["9:16", "1:1"]]
+
+TEXT_KEYS = ["min_chars", "max_chars", "max_words", "max_emojis", "hook_first_50_chars", "allow_hashtags", "allow_mentions"]
+IMAGE_KEYS = ["aspect_ratio", "min_resolution", "max_file_size_mb", "text_overlay_allowed", "branding_required", "branding_position"]
+VIDEO_KEYS = ["max_duration_sec", "aspect_ratio", "aspect_ratios", "captions_required", "hook_first_sec", "branding_first_sec"]
+CAROUSEL_KEYS = ["aspect_ratio", "safe_zone_required", "ugc_style", "recommended_use_cases"]
+MEDIA_TYPES = ["image", "video", "photo_carousel", "audio"]
+
+def _random_dict(rng: random.Random, keys: list) -> dict:
+    values = {key: rng.choice(_VALUES) for key in keys}
+    return {key: value for key, value in values.items() if value is not _MISSING}
+
+def _random_media_constraints(rng: random.Random) -> dict:
+    # Shaped like normalize_plan's output: image and video are always dicts.
+    mc = _random_dict(rng, CAROUSEL_KEYS)
+    mc["image"] = _random_dict(rng, IMAGE_KEYS)
+    mc["video"] = _random_dict(rng, VIDEO_KEYS)
+    mc["image_count"] = rng.choice([None, 3, _random_dict(rng, ["min", "max"])])
+    return mc
+
+@pytest.mark.parametrize("seed", range(20))
+def test_text_prompt_matches_template(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        tc = _random_dict(rng, TEXT_KEYS)
+        expected = _TEXT_TMPL.render(platform="X", content_type="post", objective="engagement", tone="witty", text_constraints=tc)
+        assert orchestration._render_text_prompt("X", "post", "engagement", "witty", tc) == expected, tc
+
+@pytest.mark.parametrize("media_type", MEDIA_TYPES)
+@pytest.mark.parametrize("seed", range(10))
+def test_media_prompt_matches_template(media_type, seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        mc = _random_media_constraints(rng)
+        expected = _MEDIA_TMPL.render(platform="TikTok", content_type="video", objective="reach", media_type=media_type, media_constraints=mc)
+        assert orchestration._render_media_prompt("TikTok", "video", "reach", media_type, mc) == expected, mc